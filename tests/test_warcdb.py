@@ -1,15 +1,33 @@
+import hashlib
 import os
 import pathlib
 import re
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 
 import pytest
 import sqlite_utils
 from click.testing import CliRunner
-from warcdb import warcdb_cli
+from warcdb import WarcDB, iter_rows, parse_warcs, warc_sources, warcdb_cli
+from warcdb.migrations import migration
 
 db_file = "test_warc.db"
 tests_dir = pathlib.Path(__file__).parent
 
+
+@pytest.fixture
+def tests_url():
+    """Serve the test files over HTTP, as non-seekable streams"""
+    handler = partial(SimpleHTTPRequestHandler, directory=tests_dir)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
 # all these WARC files were created with wget except for apod.warc.gz which was
 # created with browsertrix-crawler
 
@@ -37,6 +55,7 @@ def test_import(warc_path):
         "resource",
         "response",
         "warcinfo",
+        "http_headers",
         "_sqlite_migrations",
     }
 
@@ -51,6 +70,202 @@ def test_import(warc_path):
     os.remove(db_file)
 
 
+@pytest.mark.parametrize("parser", ["warcio", "fastwarc"])
+def test_import_parser(parser):
+    if parser == "fastwarc":
+        pytest.importorskip("fastwarc")
+
+    runner = CliRunner()
+    args = ["import", db_file, str(tests_dir / "google.warc"), "--parser", parser]
+    result = runner.invoke(warcdb_cli, args)
+    assert result.exit_code == 0
+
+    db = sqlite_utils.Database(db_file)
+    assert db["request"].count == 3
+    assert db["response"].count == 3
+    assert [r["http_status"] for r in db["response"].rows] == [301, 302, 200]
+    assert db["warcinfo"].get("<urn:uuid:7ABED2CA-7CBD-48A0-92E5-0059EBFC111A>")
+
+    os.remove(db_file)
+
+
+def test_parsers_match(tmp_path):
+    pytest.importorskip("fastwarc")
+
+    warcs = [
+        str(tests_dir / name)
+        for name in [
+            "google.warc",
+            "google.warc.gz",
+            "no-warc-info.warc",
+            "frontpages.warc.gz",
+            "scoop.wacz",
+        ]
+    ]
+    dbs = {}
+    for parser in ["warcio", "fastwarc"]:
+        path = str(tmp_path / f"{parser}.db")
+        args = ["import", path, *warcs, "--parser", parser]
+        result = CliRunner().invoke(warcdb_cli, args)
+        assert result.exit_code == 0
+        dbs[parser] = sqlite_utils.Database(path)
+
+    for table in ["warcinfo", "request", "response", "metadata", "resource"]:
+        order = "warc_record_id"
+        assert list(dbs["warcio"][table].rows_where(order_by=order)) == list(
+            dbs["fastwarc"][table].rows_where(order_by=order)
+        )
+    order = "warc_record_id, position"
+    assert list(dbs["warcio"]["http_headers"].rows_where(order_by=order)) == list(
+        dbs["fastwarc"]["http_headers"].rows_where(order_by=order)
+    )
+
+
+@pytest.mark.parametrize("over_http", [False, True])
+def test_import_arc(tests_url, over_http):
+    # ARC files are read with warcio, even if fastwarc was asked for
+    pytest.importorskip("fastwarc")
+
+    runner = CliRunner()
+    if over_http:
+        arc = f"{tests_url}/example.arc"
+    else:
+        arc = str(tests_dir / "example.arc")
+    args = ["import", db_file, arc, "--parser", "fastwarc"]
+    result = runner.invoke(warcdb_cli, args)
+    assert result.exit_code == 0
+
+    db = sqlite_utils.Database(db_file)
+    assert db["warcinfo"].count == 1
+    response = next(db["response"].rows)
+    assert response["warc_target_uri"] == "http://example.com/"
+    assert response["http_status"] == 200
+    assert response["payload"] == b"Hello world\n"
+
+    os.remove(db_file)
+
+
+@pytest.mark.parametrize("parser", ["warcio", "fastwarc"])
+def test_import_url_gz(tests_url, parser):
+    if parser == "fastwarc":
+        pytest.importorskip("fastwarc")
+
+    runner = CliRunner()
+    args = ["import", db_file, f"{tests_url}/google.warc.gz", "--parser", parser]
+    result = runner.invoke(warcdb_cli, args)
+    assert result.exit_code == 0
+
+    db = sqlite_utils.Database(db_file)
+    assert db["response"].count == 3
+
+    os.remove(db_file)
+
+
+def test_import_fast():
+    runner = CliRunner()
+    args = ["import", "--fast", db_file, str(tests_dir / "google.warc")]
+    result = runner.invoke(warcdb_cli, args)
+    assert result.exit_code == 0
+
+    db = sqlite_utils.Database(db_file)
+    assert db.journal_mode == "wal"
+    assert db["response"].count == 3
+
+    for path in pathlib.Path().glob(f"{db_file}*"):
+        os.remove(path)
+
+
+def test_import_payload_dir(tmp_path):
+    runner = CliRunner()
+    args = [
+        "import",
+        db_file,
+        str(tests_dir / "frontpages.warc.gz"),
+        "--payload-dir",
+        str(tmp_path),
+    ]
+    result = runner.invoke(warcdb_cli, args)
+    assert result.exit_code == 0
+
+    db = sqlite_utils.Database(db_file)
+    stored = list(db.query("select * from response where payload_path is not null"))
+    assert stored
+    for row in stored:
+        assert row["payload"] is None
+        data = (tmp_path / row["payload_path"]).read_bytes()
+        assert len(data) > 64 * 1024
+        assert hashlib.sha1(data).hexdigest() == row["payload_sha1"]
+
+    os.remove(db_file)
+
+
+def test_import_jobs():
+    runner = CliRunner()
+    args = [
+        "import",
+        db_file,
+        str(tests_dir / "google.warc"),
+        str(tests_dir / "scoop.wacz"),
+        "--jobs",
+        "2",
+        # many more batches than fit in the queue
+        "--batch-size",
+        "2",
+    ]
+    result = runner.invoke(warcdb_cli, args)
+    assert result.exit_code == 0
+
+    db = sqlite_utils.Database(db_file)
+    assert db["warcinfo"].count == 2
+    assert db["response"].count == 110
+    assert db.table("request").get("<urn:uuid:524F62DD-D788-4085-B14D-22B0CDC0AC53>")
+
+    os.remove(db_file)
+
+
+def test_import_jobs_abort():
+    # workers blocked on a full queue must stop when the import fails
+    sources = warc_sources([str(tests_dir / "scoop.wacz")] * 3)
+    rows = parse_warcs(list(sources), 2, batch_size=1)
+    next(rows)
+    rows.close()
+
+
+def test_import_jobs_error():
+    runner = CliRunner()
+    args = ["import", db_file, str(tests_dir / "missing.warc"), "--jobs", "2"]
+    result = runner.invoke(warcdb_cli, args)
+    assert isinstance(result.exception, FileNotFoundError)
+
+    os.remove(db_file)
+
+
+def test_insert_rows():
+    db = WarcDB(db_file, batch_size=2)
+    migration.apply(db.db)
+    with open(tests_dir / "google.warc", "rb") as stream:
+        db.insert_rows(iter_rows(stream))
+
+    assert db.table("request").count == 3
+    assert db.table("response").count == 3
+    assert db.http_headers.count == 60
+
+    os.remove(db_file)
+
+
+def test_insert_rows_without_migrations():
+    db = WarcDB(db_file)
+    with open(tests_dir / "google.warc", "rb") as stream:
+        db.insert_rows(iter_rows(stream))
+
+    # http_headers gets the same schema as from the migrations
+    assert "COLLATE NOCASE" in db.http_headers.schema
+    assert ["header", "warc_record_id"] in [i.columns for i in db.http_headers.indexes]
+    assert db.http_headers.count_where("header = 'content-type'") == 3
+
+    os.remove(db_file)
+
+
 def test_column_names():
     runner = CliRunner()
     runner.invoke(
@@ -90,8 +305,47 @@ def test_http_header():
         "warc_record_id": "<urn:uuid:6E9096E2-5D54-4CD6-A157-1DE4A7040DEB>",
     } in req_headers
 
+    content_types = db["http_headers"].rows_where("header = ?", ["Content-Type"])
+    assert len(list(content_types)) == 3
+    assert ["header", "warc_record_id"] in [
+        i.columns for i in db["http_headers"].indexes
+    ]
 
-def test_http_header():
+    os.remove(db_file)
+
+
+def test_missing_index_is_restored():
+    # e.g. after an import was killed while the index was dropped
+    runner = CliRunner()
+    args = ["import", db_file, str(tests_dir / "google.warc")]
+    assert runner.invoke(warcdb_cli, args).exit_code == 0
+
+    db = sqlite_utils.Database(db_file)
+    db.execute("DROP INDEX idx_http_headers_header_warc_record_id")
+    assert runner.invoke(warcdb_cli, args).exit_code == 0
+    assert ["header", "warc_record_id"] in [
+        i.columns for i in db["http_headers"].indexes
+    ]
+
+    os.remove(db_file)
+
+
+def test_column_types():
+    runner = CliRunner()
+    runner.invoke(
+        warcdb_cli, ["import", db_file, str(pathlib.Path("tests/google.warc"))]
+    )
+    db = sqlite_utils.Database(db_file)
+    for table in ["warcinfo", "request", "response", "metadata", "resource"]:
+        types = db.execute(
+            f"SELECT DISTINCT typeof(content_length), typeof(warc_date) FROM {table}"
+        ).fetchall()
+        assert types == [("integer", "text")]
+
+    os.remove(db_file)
+
+
+def test_http_status():
     runner = CliRunner()
     runner.invoke(
         warcdb_cli, ["import", db_file, str(pathlib.Path("tests/google.warc"))]
@@ -1,32 +1,59 @@
-import datetime
+import hashlib
+import io
+import mmap
+import os
+import sqlite3
+import tempfile
 import zipfile
+import zlib
+from collections import defaultdict
 from collections.abc import MutableMapping
+from contextlib import contextmanager
 from functools import cache
 from itertools import chain
 from json import dumps
+from queue import Empty, Full
 
 import click
-import requests as req
 import sqlite_utils
 from more_itertools import always_iterable
+from sqlite_utils.db import SQLITE_MAX_VARS
+from sqlite_utils.utils import suggest_column_types
 from tqdm import tqdm
 from warcio import ArchiveIterator, StatusAndHeaders
+from warcio.bufferedreaders import BufferedReader, ChunkedDataReader
 from warcio.recordloader import ArcWarcRecord
 
-from warcdb.migrations import migration
+from warcdb.migrations import HTTP_HEADERS_SQL, migration
 
+try:
+    from isal import igzip
+except ImportError:
+    igzip = None
 
-def dict_union(*args):
-    """Utility function to union multiple dicts"""
-    # https://stackoverflow.com/a/15936211/1333954
-    return dict(chain.from_iterable(d.iteritems() for d in args))
+try:
+    from fastwarc.warc import ArchiveIterator as FastArchiveIterator
+    from fastwarc.warc import WarcRecordType
+except ImportError:
+    FastArchiveIterator = None
+
+
+@cache  # There are only a handful of distinct WARC header names
+def column_name(header):
+    """Column name for a WARC header, e.g. WARC-Record-ID -> warc_record_id"""
+    return header.lower().replace("-", "_")
 
 
 """ Monkeypatch warcio.StatusAndHeaders.to_json() """
 
 
 def headers_to_json(self):
-    return dumps([{"header": h, "value": v} for h, v in self.headers])
+    return http_headers_to_json(self.headers)
+
+
+def http_headers_to_json(headers):
+    """Serialize (name, value) header pairs the way they are stored in the db"""
+    return dumps([{"header": h, "value": v} for h, v in headers], separators=(",", ":"))
 
 
 setattr(StatusAndHeaders, "to_json", headers_to_json)
@@ -34,9 +61,15 @@ setattr(StatusAndHeaders, "to_json", headers_to_json)
 """ Monkeypatch warcio.ArcWarcRecord.payload """
 
 
-@cache  # It's important that we cache this, as the content_stream() can only be consumed once.
 def record_payload(self: ArcWarcRecord):
-    return self.content_stream().read()
+    # content_stream() can only be consumed once, so the payload is kept on
+    # the record itself. A functools.cache would pin every record (and its
+    # payload) in memory for the lifetime of the process.
+    try:
+        return self._payload
+    except AttributeError:
+        self._payload = self.content_stream().read()
+        return self._payload
 
 
 setattr(ArcWarcRecord, "payload", record_payload)
@@ -44,10 +77,9 @@ setattr(ArcWarcRecord, "payload", record_payload)
 """ Monkeypatch warcio.ArcWarcRecord.as_dict() """
 
 
-@cache
 def record_as_dict(self: ArcWarcRecord):
     """Method to easily represent a record as a dict, to be fed into db_utils.Database.insert()"""
-    return {k.lower().replace("-", "_"): v for k, v in self.rec_headers.headers}
+    return {column_name(k): v for k, v in self.rec_headers.headers}
 
 
 setattr(ArcWarcRecord, "as_dict", record_as_dict)
@@ -62,6 +94,409 @@ setattr(ArcWarcRecord, "as_dict", record_as_dict)
 # setattr(ArcWarcRecord, 'to_json', record_to_json)
 
 
+# Declared types for columns of record tables that are created on the fly.
+# Values are never converted in Python: SQLite's column affinity turns e.g. the
+# Content-Length strings into integers as rows are stored.
+COLUMN_TYPES = {
+    "content_length": int,
+    "http_status": int,
+    "payload": bytes,
+    "warc_date": str,
+}
+
+# Number of rows written between commits during `warcdb import`
+COMMIT_EVERY = 20000
+
+# With `warcdb import --payload-dir`, payloads larger than this are written
+# to files instead of the database
+PAYLOAD_INLINE_MAX = 64 * 1024
+PAYLOAD_CHUNK_SIZE = 64 * 1024
+
+# Maximum number of rows inserted by a single INSERT statement
+MULTI_ROW_INSERT = 500
+
+# How gzipped files start
+GZIP_MAGIC = b"\x1f\x8b"
+
+# How uncompressed WARC and ARC files start
+UNCOMPRESSED_MAGIC = (b"WARC/", b"filedesc")
+
+# Connection settings used for bulk loads with `warcdb import --fast`
+FAST_PRAGMAS = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA temp_store=MEMORY;
+PRAGMA cache_size=-262144;
+"""
+
+# Records that warcio parses HTTP headers for, if their URI is http(s)
+HTTP_REC_TYPES = ("request", "response", "revisit")
+HTTP_SCHEMES = ("http:", "https:")
+
+# Secondary indexes, by table. These are dropped while loading into an empty
+# table, and created again with IF NOT EXISTS at the start and end of every
+# import in case an earlier import was killed before it could do so.
+INDEXES = {"http_headers": [("header", "warc_record_id")]}
+
+# Depending on the record type we insert to the appropriate table, so this is
+# the one place that decides which rec_types are supported
+REC_TYPE_TABLES = {
+    "warcinfo": {"pk": "warc_record_id"},
+    "request": {
+        "pk": "warc_record_id",
+        "foreign_keys": [("warc_warcinfo_id", "warcinfo", "warc_record_id")],
+    },
+    "response": {
+        "pk": "warc_record_id",
+        "foreign_keys": [
+            ("warc_warcinfo_id", "warcinfo", "warc_record_id"),
+            ("warc_concurrent_to", "request", "warc_record_id"),
+        ],
+    },
+    "metadata": {
+        "pk": "warc_record_id",
+        "foreign_keys": [
+            ("warc_warcinfo_id", "warcinfo", "warc_record_id"),
+            ("warc_concurrent_to", "response", "warc_record_id"),
+        ],
+    },
+    "resource": {
+        "pk": "warc_record_id",
+        "foreign_keys": [
+            ("warc_warcinfo_id", "warcinfo", "warc_record_id"),
+            ("warc_concurrent_to", "metadata", "warc_record_id"),
+        ],
+    },
+}
+
+
+def read_payload(stream, payload_dir=None):
+    """Read a record payload into the columns that store it.
+
+    Without a payload_dir the whole payload goes in the payload column.
+    Otherwise payloads larger than PAYLOAD_INLINE_MAX are streamed to a file
+    in payload_dir named after their SHA-1, and only payload_sha1 and
+    payload_path (relative to payload_dir) are stored in the row.
+    """
+    if payload_dir is None:
+        return {"payload": stream.read()}
+
+    buf = bytearray()
+    while len(buf) <= PAYLOAD_INLINE_MAX:
+        chunk = stream.read(PAYLOAD_CHUNK_SIZE)
+        if not chunk:
+            return {"payload": bytes(buf)}
+        buf += chunk
+
+    sha1 = hashlib.sha1(buf)
+    with tempfile.NamedTemporaryFile(dir=payload_dir, delete=False) as tmp:
+        tmp.write(buf)
+        del buf
+        for chunk in iter(lambda: stream.read(PAYLOAD_CHUNK_SIZE), b""):
+            sha1.update(chunk)
+            tmp.write(chunk)
+
+    digest = sha1.hexdigest()
+    payload_path = os.path.join(digest[:2], digest[2:])
+    os.makedirs(os.path.join(payload_dir, digest[:2]), exist_ok=True)
+    os.replace(tmp.name, os.path.join(payload_dir, payload_path))
+    return {"payload_sha1": digest, "payload_path": payload_path}
+
+
+def record_to_row(r: ArcWarcRecord, payload_dir=None):
+    """Build the row dict that is stored for a record in its rec_type table"""
+    record_dict = r.as_dict()
+
+    # Certain rec_types have payload (all of the ones we have a table for)
+    has_payload = r.rec_type in REC_TYPE_TABLES
+    if has_payload:
+        if payload_dir is None:
+            record_dict["payload"] = r.payload()
+        else:
+            record_dict.update(read_payload(r.content_stream(), payload_dir))
+
+    # Certain rec_types have http_headers, which go to the http_headers table
+    has_http_headers = r.http_headers is not None
+    if has_http_headers:
+        record_dict["http_headers"] = r.http_headers.headers
+        if r.rec_type == "response":
+            record_dict["http_status"] = r.http_headers.get_statuscode()
+
+    return record_dict
+
+
+def fastwarc_record_to_row(rec, payload_dir=None):
+    """Same as record_to_row(), for a fastwarc.warc.WarcRecord.
+
+    The record is read the way warcio would read it, so that both parsers
+    store exactly the same rows.
+    """
+    record_dict = {column_name(k): v for k, v in rec.headers}
+    rec_type = record_dict.get("warc_type")
+
+    # warcio strips the <> that some crawlers (e.g. wget) put around the
+    # target URI and percent-encodes spaces in it
+    uri = record_dict.get("warc_target_uri")
+    if uri is not None:
+        if uri.startswith("<") and uri.endswith(">"):
+            uri = uri[1:-1]
+        uri = uri.replace(" ", "%20")
+        record_dict["warc_target_uri"] = uri
+
+    # and it only parses HTTP headers of non-empty http(s) records
+    http_headers = None
+    if (
+        rec.content_length
+        and rec_type in HTTP_REC_TYPES
+        and uri is not None
+        and uri.startswith(HTTP_SCHEMES)
+    ):
+        rec.parse_http(auto_decode="none")
+        http_headers = rec.http_headers
+
+    record_dict.update(
+        read_payload(decoded_stream(rec.reader, http_headers), payload_dir)
+    )
+
+    if http_headers is not None:
+        record_dict["http_headers"] = http_headers.astuples()
+        if rec_type == "response":
+            record_dict["http_status"] = http_headers.status_code
+
+    return record_dict
+
+
+def decoded_stream(stream, http_headers):
+    """Undo the Transfer-Encoding and Content-Encoding of an HTTP payload,
+    using the same readers as warcio's ArcWarcRecord.content_stream()"""
+    if http_headers is None:
+        return stream
+
+    encoding = http_headers.get("Content-Encoding")
+    if encoding:
+        encoding = encoding.lower()
+        if encoding not in BufferedReader.get_supported_decompressors():
+            encoding = None
+
+    if http_headers.get("Transfer-Encoding") == "chunked":
+        return ChunkedDataReader(stream, decomp_type=encoding)
+    elif encoding:
+        return BufferedReader(stream, decomp_type=encoding)
+    else:
+        return stream
+
+
+def iter_rows(stream, parser="warcio", payload_dir=None):
+    """Yield (rec_type, row) pairs for every record in a WARC stream"""
+    if parser == "fastwarc" and not is_arc(stream):
+        for rec in FastArchiveIterator(
+            stream, record_types=WarcRecordType.any_type, parse_http=False
+        ):
+            row = fastwarc_record_to_row(rec, payload_dir)
+            yield row.get("warc_type"), row
+    else:
+        for r in ArchiveIterator(stream, arc2warc=True):
+            yield r.rec_type, record_to_row(r, payload_dir)
+
+
+def is_arc(stream):
+    """Check if a stream holds a legacy ARC file, without consuming it.
+
+    FastWARC can't read ARC files, so these are always parsed with warcio.
+    Streams that can't be peeked at are assumed to be ARCs too, since warcio
+    reads both.
+    """
+    if isinstance(stream, mmap.mmap):
+        magic = stream[:8]
+    elif hasattr(stream, "peek"):
+        magic = stream.peek(8)
+        if magic.startswith(GZIP_MAGIC):
+            magic = zlib.decompressobj(31).decompress(magic)
+    else:
+        return True
+    return magic.startswith(b"filedesc")
+
+
+def warc_sources(warc_paths):
+    """Expand import arguments into (location, member) pairs, one per WARC.
+
+    member is the name of a WARC inside a local WACZ file, otherwise None.
+    """
+    for f in always_iterable(warc_paths):
+        if f.endswith(".wacz") and not f.startswith("http"):
+            # TODO: can we support loading WACZ files by URL?
+            wacz = zipfile.ZipFile(f)
+            for warc in wacz.infolist():
+                if warc.filename.endswith("warc.gz"):
+                    yield f, warc.filename
+        else:
+            yield f, None
+
+
+def open_warc(location, member=None):
+    """Open a WARC from a URL, a local file or a member of a WACZ file"""
+    if location.startswith("http"):
+        # Imported here since requests adds noticeably to every CLI start
+        import requests as req
+
+        # Not gunzip()ed: GzipFile claims to be seekable even though the
+        # response isn't, which FastWARC trips over. Both parsers decompress
+        # gzipped WARCs themselves. The buffering lets is_arc() peek at it,
+        # which needs the response to stay open at its end.
+        stream = req.get(location, stream=True).raw
+        stream.auto_close = False
+        return io.BufferedReader(stream)
+    elif member:
+        return gunzip(zipfile.ZipFile(location).open(member, "r"))
+    else:
+        return open_local_warc(location)
+
+
+def open_local_warc(path):
+    """Open a local WARC file, memory-mapping it if it isn't compressed.
+
+    Reading an uncompressed WARC through mmap lets the kernel page it in as
+    the parser goes instead of copying it through read() buffers. Compressed
+    files are returned as regular files, since the decompressor needs its
+    own buffers anyway.
+    """
+    f = open(path, "rb")
+    magic = f.read(8)
+    f.seek(0)
+    if magic.startswith(GZIP_MAGIC):
+        return gunzip(f)
+    elif not magic.startswith(UNCOMPRESSED_MAGIC):
+        return f
+
+    with f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mmap, "MADV_SEQUENTIAL"):  # Not available on Windows
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+    return mm
+
+
+def gunzip(stream):
+    """Decompress a gzipped WARC stream with ISA-L, if isal is installed.
+
+    Otherwise the stream is returned as is and the parser decompresses it
+    with zlib, which is 2-3x slower.
+    """
+    if igzip is None:
+        return stream
+    return igzip.GzipFile(fileobj=stream)
+
+
+# The queue and abort flag of an import worker, see init_worker()
+worker_queue = None
+worker_aborted = None
+
+
+def init_worker(queue, aborted):
+    """Set up a worker process of `warcdb import --jobs`"""
+    global worker_queue, worker_aborted
+    worker_queue, worker_aborted = queue, aborted
+    # Everything a worker puts on the queue is read before a normal exit, and
+    # after an abort nobody reads it, so don't wait for it to be flushed
+    queue.cancel_join_thread()
+
+
+def put_batch(batch):
+    """Put a batch on the worker queue, waiting while it's full unless the
+    import is aborted"""
+    while not worker_aborted.is_set():
+        try:
+            worker_queue.put(batch, timeout=1)
+            return
+        except Full:
+            pass
+
+
+def parse_warc(source, parser="warcio", payload_dir=None, batch_size=1000):
+    """Parse a WARC, putting its records on the worker queue in (rec_type, rows)
+    batches.
+
+    This runs in the worker processes of `warcdb import --jobs`. The queue is
+    bounded, so a worker waits for the database to catch up instead of piling
+    up parsed records. None is put on the queue when the WARC is done, even
+    if parsing it failed.
+    """
+    try:
+        buckets = defaultdict(list)
+        for rec_type, row in iter_rows(open_warc(*source), parser, payload_dir):
+            bucket = buckets[rec_type]
+            bucket.append(row)
+            if len(bucket) >= batch_size:
+                put_batch((rec_type, bucket))
+                buckets[rec_type] = []
+        for rec_type, bucket in buckets.items():
+            if bucket:
+                put_batch((rec_type, bucket))
+    finally:
+        put_batch(None)
+
+
+def parse_warcs(sources, jobs, parser="warcio", payload_dir=None, batch_size=1000):
+    """Yield (rec_type, row) pairs for WARCs that are parsed by parse_warc() in
+    a pool of worker processes.
+
+    At most a couple of batches per worker are waiting in the queue at any
+    time, however large the WARCs are.
+    """
+    # Imported here since they're only needed with --jobs
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    queue = multiprocessing.Queue(maxsize=2 * jobs)
+    aborted = multiprocessing.Event()
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=init_worker, initargs=(queue, aborted)
+    ) as executor:
+        futures = [
+            executor.submit(parse_warc, source, parser, payload_dir, batch_size)
+            for source in sources
+        ]
+        try:
+            with tqdm(total=len(futures)) as progress:
+                while progress.n < len(futures):
+                    try:
+                        batch = queue.get(timeout=1)
+                    except Empty:
+                        # a worker that died can't say it's done
+                        for future in futures:
+                            if future.done() and future.exception():
+                                future.result()
+                        continue
+                    if batch is None:
+                        progress.update()
+                        continue
+                    rec_type, rows = batch
+                    for row in rows:
+                        yield rec_type, row
+        finally:
+            # Stops the workers if the import failed, so that the executor
+            # doesn't wait forever for them to put batches on a full queue
+            aborted.set()
+            for future in futures:
+                future.cancel()
+        # raise the error of any WARC that failed to parse
+        for future in futures:
+            future.result()
+
+
+def values_getter(columns):
+    """Compile a function that returns a row dict's values in column order.
+
+    The generated function spells out one row.get() per column, which is
+    noticeably faster than looping over the columns for every row.
+    """
+    source = "def to_values(row):\n    get = row.get\n    return [{}]\n".format(
+        ", ".join(f"get({c!r})" for c in columns)
+    )
+    namespace = {}
+    exec(source, namespace)
+    return namespace["to_values"]
+
+
 class WarcDB(MutableMapping):
     """
     Wrapper around sqlite_utils.Database
@@ -80,10 +515,24 @@ class WarcDB(MutableMapping):
         # First pop warcdb - specific params
         self._batch_size = kwargs.pop("batch_size", 1000)
         self._records_table = kwargs.get("records_table", "records")
+        fast = kwargs.pop("fast", False)
+        self._columns = {}
+        self._inserts = {}
 
         # Pass the rest to sqlite_utils
         self._db = sqlite_utils.Database(*args, **kwargs)
 
+        # Table objects for everything the importer writes to, so they aren't
+        # rebuilt for every batch
+        self._tables = {
+            name: self._db.table(name) for name in [*REC_TYPE_TABLES, "http_headers"]
+        }
+
+        if fast:
+            # Trade durability for speed: a crash mid-import may lose the
+            # last transactions, but re-running the import is safe.
+            self._db.conn.executescript(FAST_PRAGMAS)
+
     @property
     def db(self) -> sqlite_utils.Database:
         return self._db
@@ -139,95 +588,177 @@ class WarcDB(MutableMapping):
         * All 'response', 'resource', 'request', 'revisit', 'conversion' and 'continuation' records may have a payload.
         All 'warcinfo' and 'metadata' records shall not have a payload.
         """
-        col_type_conversions = {
-            "content_length": int,
-            "payload": str,
-            "warc_date": datetime.datetime,
-        }
-        record_dict = r.as_dict()
-
-        # Certain rec_types have payload
-        has_payload = r.rec_type in [
-            "warcinfo",
-            "request",
-            "response",
-            "metadata",
-            "resource",
-        ]
-        if has_payload:
-            record_dict["payload"] = r.payload()
+        self.insert_rows([(r.rec_type, record_to_row(r))])
+        return self
 
-        # Certain rec_types have http_headers
-        has_http_headers = r.http_headers is not None
-        if has_http_headers:
-            record_dict["http_headers"] = r.http_headers.to_json()
-
-        """Depending on the record type we insert to appropriate record"""
-        if r.rec_type == "warcinfo":
-            self.db.table("warcinfo").insert(
-                record_dict,
-                pk="warc_record_id",
-                alter=True,
-                ignore=True,
-                columns=col_type_conversions,
-            )
-        elif r.rec_type == "request":
-            self.db.table("request").insert(
-                record_dict,
-                pk="warc_record_id",
-                foreign_keys=[("warc_warcinfo_id", "warcinfo", "warc-record-id")],
-                alter=True,
-                ignore=True,
-                columns=col_type_conversions,
-            )
+    def insert_rows(self, rows):
+        """Insert (rec_type, row) pairs, as yielded by iter_rows().
 
-        elif r.rec_type == "response":
-            if r.http_headers:
-                record_dict["http_status"] = r.http_headers.get_statuscode()
-            self.db.table("response").insert(
-                record_dict,
-                pk="warc_record_id",
-                foreign_keys=[
-                    ("warc_warcinfo_id", "warcinfo", "warc_record_id"),
-                    ("warc_concurrent_to", "request", "warc_record_id"),
-                ],
-                alter=True,
-                ignore=True,
-                columns=col_type_conversions,
-            )
+        Rows are grouped by rec_type and written batch_size at a time with
+        plain sqlite3 statements, committing every COMMIT_EVERY rows.
+        """
+        # WARCs often reference records that live in other files (or nowhere),
+        # so never have SQLite check foreign keys row by row while loading.
+        # The PRAGMA is a no-op inside a transaction, so set it before one.
+        conn = self.db.conn
+        foreign_keys = conn.execute("PRAGMA foreign_keys").fetchone()[0]
+        conn.execute("PRAGMA foreign_keys=OFF")
+        try:
+            buckets = defaultdict(list)
+            uncommitted = 0
+            with conn:
+                for rec_type, row in rows:
+                    bucket = buckets[rec_type]
+                    bucket.append(row)
+                    if len(bucket) >= self._batch_size:
+                        self._insert_records(rec_type, bucket)
+                        uncommitted += len(bucket)
+                        bucket.clear()
+                        if uncommitted >= COMMIT_EVERY:
+                            conn.commit()
+                            uncommitted = 0
+
+                for rec_type, bucket in buckets.items():
+                    if bucket:
+                        self._insert_records(rec_type, bucket)
+        finally:
+            conn.execute(f"PRAGMA foreign_keys={foreign_keys}")
+
+    @contextmanager
+    def deferred_indexes(self):
+        """Drop the INDEXES of empty tables while bulk loading into them.
+
+        Building an index over a fully loaded table is a single sort, which
+        is faster than updating it for every inserted row. Tables that
+        already have rows keep their indexes, since rebuilding those would
+        cost more than it saves. Primary keys are left alone: INSERT OR
+        IGNORE relies on them to skip records that were already imported.
+        """
+        deferred = []
+        with self.db.conn:
+            for table_name, indexes in INDEXES.items():
+                table = self._tables[table_name]
+                if not table.exists():
+                    continue
+                has_rows = table.count
+                for columns in indexes:
+                    # same name as sqlite_utils gives it, e.g. in migrations
+                    name = f"idx_{table_name}_{'_'.join(columns)}"
+                    if has_rows:
+                        table.create_index(columns, name, if_not_exists=True)
+                    else:
+                        self.db.execute(f"DROP INDEX IF EXISTS [{name}]")
+                        deferred.append((table, columns, name))
+        try:
+            yield
+        finally:
+            with self.db.conn:
+                for table, columns, name in deferred:
+                    table.create_index(columns, name, if_not_exists=True)
+
+    def _insert_records(self, rec_type, dicts):
+        """Insert a batch of row dicts of the same rec_type into its table.
+
+        Any http_headers in the rows are moved to the http_headers table.
+        This doesn't commit, so that callers can group many batches into a
+        single transaction.
+        """
+        try:
+            table_kwargs = REC_TYPE_TABLES[rec_type]
+        except KeyError:
+            raise ValueError(
+                f"Record type <{rec_type}> is not supported. "
+                f"Only [{', '.join(REC_TYPE_TABLES)}] are."
+            ) from None
+
+        header_dicts = [
+            {
+                "warc_record_id": row["warc_record_id"],
+                "position": position,
+                "header": header,
+                "value": value,
+            }
+            for row in dicts
+            for position, (header, value) in enumerate(row.pop("http_headers", ()))
+        ]
 
-        elif r.rec_type == "metadata":
-            self.db.table("metadata").insert(
-                record_dict,
-                pk="warc_record_id",
-                foreign_keys=[
-                    ("warc-warcinfo-id", "warcinfo", "warc_record_id"),
-                    ("warc_concurrent_to", "response", "warc_record_id"),
-                ],
-                alter=True,
-                ignore=True,
-                columns=col_type_conversions,
-            )
+        self._insert_rows(rec_type, dicts, table_kwargs)
+        if header_dicts:
+            self._insert_rows("http_headers", header_dicts)
 
-        elif r.rec_type == "resource":
-            self.db.table("resource").insert(
-                record_dict,
-                pk="warc_record_id",
-                foreign_keys=[
-                    ("warc-warcinfo-id", "warcinfo", "warc_record_id"),
-                    ("warc_concurrent_to", "metadata", "warc_record_id"),
-                ],
-                alter=True,
-                ignore=True,
-                columns=col_type_conversions,
-            )
+    def _insert_rows(self, table_name, dicts, table_kwargs=None):
+        """INSERT OR IGNORE dicts into a table, adding any missing columns.
 
-        else:
-            raise ValueError(
-                f"Record type <{r.rec_type}> is not supported"
-                f"Only [warcinfo, request, response, metadata, resource] are."
+        Missing tables are created with table_kwargs, except for http_headers,
+        which always gets the schema and indexes that the migrations give it.
+        """
+        table = self._tables[table_name]
+
+        # The table's columns are looked up once and then only change when
+        # a batch brings new WARC headers, so we don't ask SQLite every time
+        columns = self._columns.get(table_name)
+        if columns is None:
+            columns = self._columns[table_name] = list(table.columns_dict)
+        if not set(columns).issuperset(set().union(*dicts)):
+            # Keep schema changes in their own short transaction
+            with self.db.conn:
+                if columns:
+                    table.add_missing_columns(dicts)
+                elif table_name == "http_headers":
+                    # Header names compare case-insensitively, as in HTTP
+                    self.db.execute(HTTP_HEADERS_SQL)
+                    for index in INDEXES[table_name]:
+                        table.create_index(index, if_not_exists=True)
+                else:
+                    column_types = suggest_column_types(dicts)
+                    for column in column_types.keys() & COLUMN_TYPES:
+                        column_types[column] = COLUMN_TYPES[column]
+                    table.create(column_types, **table_kwargs)
+            columns = self._columns[table_name] = list(table.columns_dict)
+            self._inserts.pop(table_name, None)
+
+        # Every row is bound to all of the table's columns, so the statement
+        # text stays the same for the whole import and sqlite3 only has to
+        # prepare it once. Most rows go through a statement that inserts
+        # many rows at a time, the leftovers are inserted one by one.
+        statements = self._inserts.get(table_name)
+        if statements is None:
+            statements = self._inserts[table_name] = self._insert_statements(
+                table_name, columns
             )
-        return self
+        sql, multi_sql, rows_per_statement, to_values = statements
+
+        rows = [to_values(row) for row in dicts]
+        full = len(rows) - len(rows) % rows_per_statement
+        if full:
+            self.db.conn.executemany(
+                multi_sql,
+                (
+                    list(chain.from_iterable(rows[i : i + rows_per_statement]))
+                    for i in range(0, full, rows_per_statement)
+                ),
+            )
+        self.db.conn.executemany(sql, rows[full:])
+
+    def _insert_statements(self, table_name, columns):
+        """Single and multi-row INSERT OR IGNORE statements for a table, and
+        the function that turns a row dict into their parameters"""
+        try:
+            max_vars = self.db.conn.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+        except AttributeError:  # Python < 3.11
+            max_vars = SQLITE_MAX_VARS
+        rows_per_statement = max(1, min(MULTI_ROW_INSERT, max_vars // len(columns)))
+
+        insert = "INSERT OR IGNORE INTO [{}] ({}) VALUES ".format(
+            table_name, ", ".join(f"[{c}]" for c in columns)
+        )
+        values = "({})".format(", ".join("?" for _ in columns))
+        return (
+            insert + values,
+            insert + ", ".join([values] * rows_per_statement),
+            rows_per_statement,
+            values_getter(columns),
+        )
 
 
 from sqlite_utils import cli as sqlite_utils_cli
@@ -246,39 +777,60 @@ warcdb_cli.help = "Commands for interacting with .warcdb files\n\nBased on SQLit
     "--batch-size",
     type=click.INT,
     default=1000,
-    help="Batch size for chunked INSERTs [Note: ignored for now]",
+    help="Batch size for chunked INSERTs",
+)
+@click.option(
+    "--parser",
+    type=click.Choice(["fastwarc", "warcio"]),
+    default="fastwarc" if FastArchiveIterator else "warcio",
+    show_default=True,
+    help="WARC parser to use; ARC files are always read with warcio",
+)
+@click.option(
+    "--fast",
+    is_flag=True,
+    help="Use WAL mode and relaxed syncing for faster bulk loads",
+)
+@click.option(
+    "--payload-dir",
+    type=click.Path(file_okay=False, dir_okay=True),
+    help="Write payloads larger than 64 KiB to files in this directory",
 )
-def import_(db_path, warc_path, batch_size):
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of processes used to parse WARC files",
+)
+def import_(db_path, warc_path, batch_size, parser, fast, payload_dir, jobs):
     """
     Import a WARC file into the database
     """
-    db = WarcDB(db_path, batch_size=batch_size)
+    if parser == "fastwarc" and FastArchiveIterator is None:
+        raise click.ClickException(
+            "fastwarc is not installed, install it or use --parser warcio"
+        )
+
+    if payload_dir:
+        os.makedirs(payload_dir, exist_ok=True)
+
+    db = WarcDB(db_path, batch_size=batch_size, fast=fast)
 
     # ensure the schema is there and up to date
     migration.apply(db.db)
 
-    # if batch_size:
-    #    warnings.warn("--batch-size has been temporarily disabled")
-
     def to_import():
-        for f in always_iterable(warc_path):
-            if f.startswith("http"):
+        if jobs > 1:
+            # Parse the WARCs in worker processes and only write to the db here
+            yield from parse_warcs(
+                warc_sources(warc_path), jobs, parser, payload_dir, batch_size
+            )
+        else:
+            for location, member in warc_sources(warc_path):
                 yield from tqdm(
-                    ArchiveIterator(req.get(f, stream=True).raw, arc2warc=True), desc=f
+                    iter_rows(open_warc(location, member), parser, payload_dir),
+                    desc=member or location,
                 )
-            elif f.endswith(".wacz"):
-                # TODO: can we support loading WACZ files by URL?
-                wacz = zipfile.ZipFile(f)
-                warcs = filter(
-                    lambda f: f.filename.endswith("warc.gz"), wacz.infolist()
-                )
-                for warc in warcs:
-                    yield from tqdm(
-                        ArchiveIterator(wacz.open(warc.filename, "r"), arc2warc=True),
-                        desc=warc.filename,
-                    )
-            else:
-                yield from tqdm(ArchiveIterator(open(f, "rb"), arc2warc=True), desc=f)
-
-    for r in to_import():
-        db += r
+
+    with db.deferred_indexes():
+        db.insert_rows(to_import())
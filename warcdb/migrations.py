@@ -124,3 +124,59 @@ def m002_headers(db):
 @migration()
 def m003_status(db):
     db["response"].add_column("http_status", int)
+
+
+@migration()
+def m004_payload_files(db):
+    for table in ["warcinfo", "request", "response", "metadata", "resource"]:
+        db[table].add_column("payload_sha1", str)
+        db[table].add_column("payload_path", str)
+
+
+# Also used by WarcDB to create the table when migrations weren't applied
+HTTP_HEADERS_SQL = """
+CREATE TABLE [http_headers] (
+    [warc_record_id] TEXT,
+    [position] INTEGER,
+    [header] TEXT COLLATE NOCASE,
+    [value] TEXT,
+    PRIMARY KEY ([warc_record_id], [position])
+)
+"""
+
+
+@migration()
+def m005_http_headers_table(db):
+    # One row per header instead of a JSON array per record, so that headers
+    # can be looked up through an index rather than json_each() over every row
+    db.execute(HTTP_HEADERS_SQL)
+    db["http_headers"].create_index(["header", "warc_record_id"])
+
+    for table in ["request", "response"]:
+        # The view has to go before transform() can rebuild the table
+        db[f"v_{table}_http_header"].drop()
+        db.execute(
+            f"""
+            INSERT INTO [http_headers]
+            SELECT
+                {table}.warc_record_id,
+                header.KEY,
+                JSON_EXTRACT(header.VALUE, '$.header'),
+                JSON_EXTRACT(header.VALUE, '$.value')
+            FROM {table}, JSON_EACH({table}.http_headers) AS header
+            """
+        )
+        db[table].transform(drop={"http_headers"})
+
+        db.create_view(
+            f"v_{table}_http_header",
+            f"""
+                SELECT
+                    {table}.warc_record_id AS warc_record_id,
+                    LOWER(http_headers.header) AS name,
+                    http_headers.value AS value
+                FROM {table}
+                JOIN http_headers
+                    ON http_headers.warc_record_id = {table}.warc_record_id
+            """,
+        )